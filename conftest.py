@@ -0,0 +1,2 @@
+# conftest.py
+# Présent à la racine pour que pytest ajoute le dépôt au sys.path et que "src" soit importable.
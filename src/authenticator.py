@@ -8,6 +8,9 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.errors import HttpError
 
+from src.config import config
+from src.credentials import TokenFileLock, save_token
+
 class Authenticator:
     """
     Handles Gmail API authentication.
@@ -22,22 +25,24 @@ class Authenticator:
         Authenticate the user and return credentials.
         """
         try:
-            if os.path.exists("token.json"):
-                self.creds = Credentials.from_authorized_user_file("token.json", self.SCOPES)
+            if os.path.exists(config.TOKEN_FILE):
+                self.creds = Credentials.from_authorized_user_file(config.TOKEN_FILE, self.SCOPES)
                 if self.creds and self.creds.valid:
                     print("Token is valid, Gmail API can be accessed.")
                     return self.creds
                 elif self.creds and self.creds.expired and self.creds.refresh_token:
-                    self.creds.refresh(Request())
+                    with TokenFileLock(config.TOKEN_FILE):
+                        self.creds.refresh(Request())
+                        save_token(self.creds, config.TOKEN_FILE)
                     print("Token refreshed.")
                     return self.creds
             else:
                 print("Token file not found. Starting authentication flow.")
                 flow = InstalledAppFlow.from_client_secrets_file("credentials.json", self.SCOPES)
                 self.creds = flow.run_local_server(port=0)
-                with open("token.json", "w") as token_file:
-                    token_file.write(self.creds.to_json())
-                print("Token saved to token.json.")
+                with TokenFileLock(config.TOKEN_FILE):
+                    save_token(self.creds, config.TOKEN_FILE)
+                print(f"Token saved to {config.TOKEN_FILE}.")
                 return self.creds
         except Exception as e:
             print(f"Authentication error: {e}")
@@ -18,8 +18,30 @@ class Config:
         self.PROMOTIONAL_SENDERS_FILE = os.path.join(self.LOGS_DIR, "promotional_senders.txt")
         self.PROMOTIONAL_SUBJECTS_FILE = os.path.join(self.LOGS_DIR, "promotional_subjects.txt")
         self.PROMOTIONAL_DOMAINS_FILE = os.path.join(self.LOGS_DIR, "promotional_domains.txt")
+        self.PROMOTIONAL_KEYWORDS_FILE = os.path.join(self.LOGS_DIR, "promotional_keywords.txt")
+
+        # Lexique de mots-clés : score minimal et langues retenues (None = toutes)
+        self.KEYWORD_THRESHOLD = 1.0
+        self.KEYWORD_LANGUAGES = None
 
         # Paramètres de performance
         self.BATCH_SIZE = 100
+        self.MAX_BATCH_MODIFY = 1000
+        self.PROGRESS_REFRESH_RATE = 10
+
+        # Authentification : rafraîchir le jeton 5 minutes avant son expiration
+        self.TOKEN_FILE = "token.json"
+        self.TOKEN_REFRESH_MARGIN = 300
+
+        # Traitement distribué
+        self.COORDINATOR_DB = os.path.join(self.LOGS_DIR, "coordinator.db")
+        self.LEASE_DURATION = 300
+
+        # Journal des opérations (annulation)
+        self.JOURNAL_DIR = os.path.join(self.LOGS_DIR, "journal")
+
+        # Corpus hors ligne pour rejouer les règles
+        self.CORPUS_FILE = os.path.join(self.LOGS_DIR, "corpus.bin")
+        self.SNAPSHOT_CORPUS = True
 
 config = Config()
\ No newline at end of file
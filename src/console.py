@@ -1,5 +1,9 @@
 # src/console.py
 
+import os
+import sys
+import time
+
 from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import Prompt, Confirm
@@ -10,6 +14,12 @@ from src.config import config
 from src.utils import Utils
 from src.authenticator import Authenticator
 from src.manager import EmailManager
+from src.coordinator import ShardCoordinator, run_worker
+from src.journal import OperationJournal
+from src.progress import RichProgressSink, JsonLinesProgressSink
+from src.corpus import MetadataCorpus, replay
+from src.rules import DetectionRules
+from src.credentials import CredentialsProvider
 
 
 class CLIConsole:
@@ -22,6 +32,7 @@ class CLIConsole:
         self.authenticator = Authenticator()
         self.manager = None
         self.creds = None
+        self.credentials = None
 
     def authenticate(self):
         """Authenticate the user and initialize the email manager"""
@@ -29,7 +40,9 @@ class CLIConsole:
         if not self.creds:
             self.console.print("[bold red]Failed to authenticate.\nPlease check your credentials and/or your Internet connection.[/bold red]")
             exit(1)
-        self.manager = EmailManager(self.creds)
+        self.credentials = CredentialsProvider(self.creds)
+        self.credentials.start()
+        self.manager = EmailManager(self.creds, credentials=self.credentials)
         return self.creds
 
     def display_header(self):
@@ -54,10 +67,13 @@ class CLIConsole:
         table.add_row("3", "Manage detection rules")
         table.add_row("4", "View statistics")
         table.add_row("5", "Test Gmail API connection")
+        table.add_row("6", "Distributed processing")
+        table.add_row("7", "Undo a previous run")
+        table.add_row("8", "Replay rules on offline corpus")
         table.add_row("0", "Exit")
 
         self.console.print(table)
-        choice = Prompt.ask("\n[bold cyan]Your choice[/bold cyan]", choices=["0", "1", "2", "3", "4", "5"], default="1")
+        choice = Prompt.ask("\n[bold cyan]Your choice[/bold cyan]", choices=["0", "1", "2", "3", "4", "5", "6", "7", "8"], default="1")
         return choice
 
     def process_emails(self, dry_run=False):
@@ -77,45 +93,50 @@ class CLIConsole:
             processed_count, promo_count = 0, 0
             
             # Chargement des règles
-            rules = [
-                Utils.read_file(config.PROMOTIONAL_SENDERS_FILE),
-                Utils.read_file(config.PROMOTIONAL_SUBJECTS_FILE),
-                Utils.read_file(config.PROMOTIONAL_DOMAINS_FILE)
-            ]
+            rules = self.load_rules()
 
             promo_message_ids = []
+            promo_reasons = {}
             message_ids = [{"id": m["id"]} for m in messages]
             
-            with Progress(
+            with self.create_progress_sink(Progress(
                 SpinnerColumn(),
                 TextColumn("[bold blue]{task.description}[/bold blue]"),
                 BarColumn(bar_width=40),
                 TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
                 TextColumn("({task.completed}/{task.total})"),
-            ) as progress:
+            )) as progress:
                 
                 
                 # Étape 1: Récupération des métadonnées
-                metadata_task = progress.add_task("[green]Récupération des métadonnées...", total=len(messages))
+                metadata_task = progress.add_task("[green]Récupération des métadonnées...", len(messages))
                 all_metadata = self.manager.batch_get_email_metadata(message_ids, progress=progress, progress_task=metadata_task)
-                progress.update(metadata_task, completed=len(messages))
+                progress.complete(metadata_task)
+
+                # Sauvegarder les métadonnées pour pouvoir rejouer les règles hors ligne
+                if config.SNAPSHOT_CORPUS:
+                    try:
+                        MetadataCorpus.save(all_metadata)
+                    except Exception as e:
+                        self.console.print(f"[yellow]Could not update the offline corpus (delete {config.CORPUS_FILE} to start a new one): {e}[/yellow]")
                 
                 # Étape 2: Analyse des emails
-                analysis_task = progress.add_task("[green]Analyzing emails...", total=len(messages))
+                analysis_task = progress.add_task("[green]Analyzing emails...", len(messages))
                 
                 for message in messages:
                     message_id = message["id"]
                     meta = all_metadata.get(message_id, {})
-                    is_promo = self.manager.is_promo_email(rules, meta)
+                    reason = self.manager.get_promo_reason(rules, meta)
                     
-                    if is_promo:
+                    if reason:
                         promo_count += 1
                         promo_message_ids.append(message)
+                        promo_reasons[message_id] = reason
                     
                     processed_count += 1
-                    progress.update(analysis_task, advance=1)
+                    progress.advance(analysis_task)
 
-                progress.update(analysis_task, completed=len(messages))
+                progress.complete(analysis_task)
             
             # Affichage des résultats
             self.console.print("\n[bold green]Results:[/bold green]")
@@ -130,25 +151,176 @@ class CLIConsole:
             if dry_run and promo_count > 0:
                 move_now = Confirm.ask("\n[bold cyan]Do you want to move these promotional emails now?[/bold cyan]")
                 if move_now:
+                    journal = OperationJournal()
                     
-                    with Progress(
+                    with self.create_progress_sink(Progress(
                         SpinnerColumn(),
                         TextColumn("[bold blue]{task.description}[/bold blue]"),
                         BarColumn(bar_width=40),
                         TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                    ) as move_progress:
-                        move_task = move_progress.add_task("[green]Moving emails...", total=len(promo_message_ids))
-                        success = self.manager.batch_apply_label(promo_message_ids, config.TARGET_FOLDER, progress=move_progress, progress_task=move_task)
-                        move_progress.update(move_task, completed=len(promo_message_ids))
+                    )) as move_progress:
+                        move_task = move_progress.add_task("[green]Moving emails...", len(promo_message_ids))
+                        success = self.manager.batch_apply_label(promo_message_ids, config.TARGET_FOLDER, progress=move_progress, progress_task=move_task, journal=journal, reasons=promo_reasons)
+                        move_progress.complete(move_task)
                     
                     if success:
                         self.console.print("[bold green]✓ Promotional emails have been moved successfully.[/bold green]")
+                        self.console.print(f"[dim]Run ID: {journal.run_id} (use 'Undo a previous run' to revert it)[/dim]")
                     else:
                         self.console.print("[bold red]✕ Some emails could not be moved. Check the logs for details.[/bold red]")
+                        if os.path.exists(journal.file_path):
+                            self.console.print(f"[dim]Run ID: {journal.run_id} (only the recorded batches can be undone)[/dim]")
         
         except Exception as e:
             self.console.print(f"[bold red]Error while processing emails: {e}[/bold red]")
 
+    def create_progress_sink(self, progress):
+        """Returns a rich progress renderer, or a JSON-lines emitter when the output is not a terminal"""
+        if not sys.stdout.isatty():
+            return JsonLinesProgressSink(refresh_per_second=config.PROGRESS_REFRESH_RATE)
+        return RichProgressSink(progress, refresh_per_second=config.PROGRESS_REFRESH_RATE)
+
+    def load_rules(self, rules_dir=None):
+        """Loads the detection rules from the rule files, or from the same files in another directory"""
+        return DetectionRules.load(rules_dir)
+
+    def replay_rules(self):
+        """Compares a candidate rule set with a baseline rule set on the offline corpus"""
+        try:
+            if not os.path.exists(config.CORPUS_FILE):
+                self.console.print("[yellow]No offline corpus found. Analyze emails first to create one.[/yellow]")
+                return
+
+            self.console.print("[dim]A rule set is a directory containing the promotional senders, subjects, domains and keywords files.[/dim]")
+            candidate_dir = Prompt.ask("[bold cyan]Candidate rules directory[/bold cyan]")
+            baseline_dir = Prompt.ask("[bold cyan]Baseline rules directory[/bold cyan]", default=config.LOGS_DIR)
+            if not os.path.isdir(candidate_dir) or not os.path.isdir(baseline_dir):
+                self.console.print("[bold red]Rules directory not found.[/bold red]")
+                return
+
+            start = time.time()
+            with self.console.status("[bold green]Replaying rules on offline corpus...[/bold green]", spinner="dots"):
+                report = replay(self.load_rules(candidate_dir), self.load_rules(baseline_dir))
+            end = time.time()
+
+            self.console.print(f"\n[bold green]Replay results[/bold green] ({report['total']} emails in {round(end - start, 2)}s):")
+            table = Table(show_header=True, header_style="bold blue")
+            table.add_column("Metric")
+            table.add_column("Value", justify="right")
+            table.add_row("Promotional (baseline)", str(report["baseline_promotional"]))
+            table.add_row("Promotional (candidate)", str(report["candidate_promotional"]))
+            table.add_row("Newly flagged", f"[yellow]+{report['added']}[/yellow]")
+            table.add_row("No longer flagged", f"[yellow]-{report['removed']}[/yellow]")
+            table.add_row("Precision vs baseline", f"{report['precision']:.1%}")
+            table.add_row("Recall vs baseline", f"{report['recall']:.1%}")
+            self.console.print(table)
+
+        except Exception as e:
+            self.console.print(f"[bold red]Error while replaying rules: {e}[/bold red]")
+
+    def manage_distributed_processing(self):
+        """Manages the shared work queue used by several GmailCleaner workers"""
+        self.console.print("\n[bold yellow]Distributed Processing:[/bold yellow]")
+        table = Table(show_header=False, box=None, padding=(0, 2, 0, 0))
+        table.add_column(style="bold cyan")
+        table.add_column()
+
+        table.add_row("1", "Create work units from unread emails")
+        table.add_row("2", "Run as worker (analyze only)")
+        table.add_row("3", "Run as worker (move promotional emails)")
+        table.add_row("4", "View aggregate report")
+        table.add_row("5", "Reset work queue")
+        table.add_row("0", "Return to main menu")
+
+        self.console.print(table)
+        choice = Prompt.ask("\n[bold cyan]Your choice[/bold cyan]", choices=["0", "1", "2", "3", "4", "5"], default="0")
+
+        if choice == "0":
+            return
+
+        try:
+            coordinator = ShardCoordinator()
+
+            if choice == "1":
+                with self.console.status("[bold green]Retrieving unread emails...[/bold green]", spinner="dots"):
+                    messages = self.manager.get_all_emails_ids()
+                units = coordinator.create_units(messages)
+                self.console.print(f"[green]✓[/green] {len(messages)} emails found, new ones split into {units} work units.")
+            elif choice in ("2", "3"):
+                worker_id = ShardCoordinator.default_worker_id()
+                with self.console.status(f"[bold green]Worker {worker_id} processing work units...[/bold green]", spinner="dots"):
+                    journal = OperationJournal(f"{time.strftime('%Y%m%d-%H%M%S')}-{worker_id}") if choice == "3" else None
+                    completed = run_worker(self.manager, self.load_rules(), coordinator, worker_id, dry_run=(choice == "2"), journal=journal)
+                self.console.print(f"[green]✓[/green] {completed} work units completed by {worker_id}.")
+            elif choice == "4":
+                self.show_aggregate_report(coordinator.aggregate_report())
+            elif choice == "5":
+                if Confirm.ask("[bold cyan]Remove every work unit and result?[/bold cyan]"):
+                    coordinator.reset()
+                    self.console.print("[green]✓[/green] Work queue reset.")
+
+        except Exception as e:
+            self.console.print(f"[bold red]Error while processing work units: {e}[/bold red]")
+
+        self.manage_distributed_processing()
+
+    def show_aggregate_report(self, report):
+        """Displays the report built from every worker's results"""
+        self.console.print(f"\n[bold green]Work units:[/bold green] {report['units_done']}/{report['units_total']} done, "
+                           f"{report['units_leased']} leased, {report['units_pending']} pending")
+        table = Table(show_header=True, header_style="bold blue")
+        table.add_column("Worker")
+        table.add_column("Units", justify="right")
+        table.add_column("Processed", justify="right")
+        table.add_column("Promotional", justify="right")
+        for worker, stats in sorted(report["workers"].items()):
+            table.add_row(worker, str(stats["units"]), str(stats["processed"]), str(stats["promotional"]))
+        table.add_row("[bold]Total[/bold]", str(report["units_done"]), str(report["processed"]), str(report["promotional"]))
+        self.console.print(table)
+
+    def undo_run(self):
+        """Reverts the label changes recorded for a previous run"""
+        try:
+            runs = OperationJournal.list_runs()
+            if not runs:
+                self.console.print("[yellow]No recorded runs found.[/yellow]")
+                return
+
+            self.console.print("\n[bold yellow]Recorded runs:[/bold yellow]")
+            table = Table(show_header=True, header_style="bold blue")
+            table.add_column("Run ID")
+            table.add_column("Emails labeled", justify="right")
+            for run_id in runs:
+                entries = OperationJournal(run_id).entries()
+                table.add_row(run_id, str(sum(len(ids) for _, _, _, ids in entries)))
+            self.console.print(table)
+
+            run_id = Prompt.ask("\n[bold cyan]Run ID to undo[/bold cyan]", choices=runs, default=runs[0], show_choices=False)
+            journal = OperationJournal(run_id)
+            rules = sorted({rule for _, _, rule, _ in journal.entries() if rule})
+            rule = None
+            if rules:
+                self.console.print(f"[dim]Rules in this run: {', '.join(rules)}[/dim]")
+                rule = Prompt.ask("[bold cyan]Only undo a rule or rule type (leave empty for the whole run)[/bold cyan]", default="") or None
+
+            count = sum(len(ids) for _, ids in journal.undo_batches(rule))
+            if not count:
+                self.console.print("[yellow]Nothing to undo.[/yellow]")
+                return
+            if not Confirm.ask(f"[bold cyan]Remove the label from {count} emails?[/bold cyan]"):
+                return
+
+            with self.console.status("[bold green]Undoing label changes...[/bold green]", spinner="dots"):
+                restored = self.manager.undo_run(journal, rule)
+
+            if restored == count:
+                self.console.print(f"[bold green]✓ {restored} emails restored.[/bold green]")
+            else:
+                self.console.print(f"[bold red]✕ {count - restored} of {count} emails could not be restored.[/bold red]")
+
+        except Exception as e:
+            self.console.print(f"[bold red]Error while undoing the run: {e}[/bold red]")
+
     def manage_detection_rules(self):
         """Manages the detection rules for promotional emails"""
         self.console.print("\n[bold yellow]Manage Detection Rules:[/bold yellow]")
@@ -162,10 +334,12 @@ class CLIConsole:
         table.add_row("4", "Add a promotional sender")
         table.add_row("5", "Add a promotional subject")
         table.add_row("6", "Add a promotional domain")
+        table.add_row("7", "View promotional keywords")
+        table.add_row("8", "Add a promotional keyword (keyword;weight;language)")
         table.add_row("0", "Return to main menu")
 
         self.console.print(table)
-        choice = Prompt.ask("\n[bold cyan]Your choice[/bold cyan]", choices=["0", "1", "2", "3", "4", "5", "6"], default="0")
+        choice = Prompt.ask("\n[bold cyan]Your choice[/bold cyan]", choices=["0", "1", "2", "3", "4", "5", "6", "7", "8"], default="0")
 
         if choice == "0":
             return
@@ -181,6 +355,10 @@ class CLIConsole:
             self.add_to_file(config.PROMOTIONAL_SUBJECTS_FILE, "promotional subject")
         elif choice == "6":
             self.add_to_file(config.PROMOTIONAL_DOMAINS_FILE, "promotional domain")
+        elif choice == "7":
+            self.view_file_content(config.PROMOTIONAL_KEYWORDS_FILE, "Promotional Keywords")
+        elif choice == "8":
+            self.add_to_file(config.PROMOTIONAL_KEYWORDS_FILE, "promotional keyword")
 
         self.manage_detection_rules()
 
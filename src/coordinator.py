@@ -0,0 +1,252 @@
+# src/coordinator.py
+
+import os
+import json
+import time
+import socket
+import sqlite3
+from contextlib import closing
+
+from src.config import config
+
+
+class ShardCoordinator:
+    """
+    Splits a mailbox into leased work units stored in a SQLite file.
+    Several GmailCleaner workers (on one or more machines sharing the file)
+    claim units, process them and commit their results.
+    """
+
+    UNIT_SIZE = config.BATCH_SIZE
+    LEASE_DURATION = config.LEASE_DURATION
+
+    def __init__(self, db_path=None, lease_duration=None):
+        self.db_path = db_path if db_path else config.COORDINATOR_DB
+        self.lease_duration = lease_duration if lease_duration else self.LEASE_DURATION
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._create_tables()
+
+    def _connect(self):
+        """
+        Open a connection in autocommit mode so that transactions are explicit.
+        """
+        return closing(sqlite3.connect(self.db_path, timeout=30, isolation_level=None))
+
+    def _create_tables(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS units (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message_ids TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    unit_id INTEGER PRIMARY KEY,
+                    worker TEXT NOT NULL,
+                    processed INTEGER NOT NULL,
+                    promo_ids TEXT NOT NULL,
+                    completed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS unit_messages (
+                    message_id TEXT PRIMARY KEY,
+                    unit_id INTEGER NOT NULL
+                )
+            """)
+
+    def create_units(self, message_ids, unit_size=UNIT_SIZE):
+        """
+        Split a list of message IDs into pending work units.
+        IDs already queued in a previous call are skipped.
+        Returns the number of units created.
+        """
+        ids = [m["id"] if isinstance(m, dict) else m for m in message_ids]
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Ne pas remettre en file des messages déjà présents dans une unité
+            queued = {row[0] for row in conn.execute("SELECT message_id FROM unit_messages")}
+            new_ids = list(dict.fromkeys(message_id for message_id in ids if message_id not in queued))
+            units = [new_ids[i:i + unit_size] for i in range(0, len(new_ids), unit_size)]
+
+            for unit in units:
+                cursor = conn.execute("INSERT INTO units (message_ids) VALUES (?)", (",".join(unit),))
+                conn.executemany(
+                    "INSERT INTO unit_messages (message_id, unit_id) VALUES (?, ?)",
+                    [(message_id, cursor.lastrowid) for message_id in unit]
+                )
+            conn.execute("COMMIT")
+        return len(units)
+
+    def claim_unit(self, worker_id):
+        """
+        Lease the next pending unit, or a unit whose lease has expired.
+        Returns a tuple (unit_id, message_ids), or None if nothing is left to claim.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE prend le verrou d'écriture : deux workers ne peuvent pas réclamer la même unité
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """
+                SELECT id, message_ids FROM units
+                WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?)
+                ORDER BY id LIMIT 1
+                """,
+                (now,)
+            ).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + self.lease_duration, row[0])
+            )
+            conn.execute("COMMIT")
+
+        unit_id, packed_ids = row
+        return unit_id, packed_ids.split(",") if packed_ids else []
+
+    def renew_lease(self, unit_id, worker_id):
+        """
+        Extend the lease of a unit still held by this worker.
+        Returns False if the lease was lost to another worker.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_duration, unit_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def release_unit(self, unit_id, worker_id):
+        """
+        Give a unit back to the queue after a failure, without waiting for its lease to expire.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE units SET status = 'pending', worker = NULL, lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+                (unit_id, worker_id)
+            )
+
+    def complete_unit(self, unit_id, worker_id, processed, promo_ids):
+        """
+        Commit the result of a unit.
+        Returns False if the lease expired and the unit was reassigned meanwhile.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE units SET status = 'done', lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+                (unit_id, worker_id)
+            )
+            if cursor.rowcount != 1:
+                conn.execute("ROLLBACK")
+                return False
+
+            conn.execute(
+                "INSERT OR REPLACE INTO results (unit_id, worker, processed, promo_ids, completed_at) VALUES (?, ?, ?, ?, ?)",
+                (unit_id, worker_id, processed, json.dumps(promo_ids), time.time())
+            )
+            conn.execute("COMMIT")
+        return True
+
+    def aggregate_report(self):
+        """
+        Build the final report over all units and committed results.
+        """
+        with self._connect() as conn:
+            status_counts = dict(conn.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+            rows = conn.execute("SELECT worker, processed, promo_ids FROM results").fetchall()
+
+        report = {
+            "units_total": sum(status_counts.values()),
+            "units_done": status_counts.get("done", 0),
+            "units_pending": status_counts.get("pending", 0),
+            "units_leased": status_counts.get("leased", 0),
+            "processed": 0,
+            "promotional": 0,
+            "workers": {},
+        }
+        for worker, processed, promo_ids in rows:
+            promo_count = len(json.loads(promo_ids))
+            report["processed"] += processed
+            report["promotional"] += promo_count
+            stats = report["workers"].setdefault(worker, {"units": 0, "processed": 0, "promotional": 0})
+            stats["units"] += 1
+            stats["processed"] += processed
+            stats["promotional"] += promo_count
+        return report
+
+    def reset(self):
+        """
+        Remove every unit and result.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM units")
+            conn.execute("DELETE FROM results")
+            conn.execute("DELETE FROM unit_messages")
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def default_worker_id():
+        """
+        Identify a worker by host name and process ID.
+        """
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_worker(manager, rules, coordinator, worker_id=None, dry_run=True, journal=None):
+    """
+    Claim and process units until none are left.
+    `manager` only needs `batch_get_email_metadata`, `get_promo_reason` and
+    `batch_apply_label`, so a fake API can be used to test several local workers.
+    Label changes are recorded in `journal` when one is given.
+    Returns the number of units completed by this worker.
+    """
+    worker_id = worker_id if worker_id else ShardCoordinator.default_worker_id()
+    completed = 0
+
+    while True:
+        claimed = coordinator.claim_unit(worker_id)
+        if claimed is None:
+            return completed
+
+        unit_id, ids = claimed
+        message_ids = [{"id": message_id} for message_id in ids]
+        try:
+            all_metadata = manager.batch_get_email_metadata(message_ids)
+
+            promo_reasons = {}
+            for message in message_ids:
+                reason = manager.get_promo_reason(rules, all_metadata.get(message["id"], {}))
+                if reason:
+                    promo_reasons[message["id"]] = reason
+            promo_message_ids = [{"id": message_id} for message_id in promo_reasons]
+
+            # Ne rien modifier si le bail a été perdu pendant la récupération des métadonnées
+            if not coordinator.renew_lease(unit_id, worker_id):
+                print(f"Lease lost on unit {unit_id}, skipping.")
+                continue
+
+            if not dry_run and promo_message_ids:
+                if not manager.batch_apply_label(promo_message_ids, journal=journal, reasons=promo_reasons):
+                    print(f"Labeling failed on unit {unit_id}, stopping worker {worker_id}.")
+                    coordinator.release_unit(unit_id, worker_id)
+                    return completed
+        except Exception:
+            # Remettre l'unité en file pour qu'un autre worker la reprenne immédiatement
+            coordinator.release_unit(unit_id, worker_id)
+            raise
+
+        if coordinator.complete_unit(unit_id, worker_id, len(message_ids), [m["id"] for m in promo_message_ids]):
+            completed += 1
@@ -0,0 +1,221 @@
+# src/corpus.py
+
+import os
+import json
+import mmap
+import array
+from concurrent.futures import ProcessPoolExecutor
+
+from src.config import config
+from src.manager import EmailManager
+from src.rules import DetectionRules
+from src.lexicon import tokenize
+
+
+class MetadataCorpus:
+    """
+    Local columnar snapshot of fetched email metadata, read through a memory map.
+
+    File layout: a magic line, a JSON header line (row count and column offsets),
+    then one block per column made of `count + 1` uint32 offsets followed by the UTF-8 values.
+    """
+
+    MAGIC = b"GMCCORPUS1\n"
+    COLUMNS = ("id", "sender", "subject", "labels")
+
+    def __init__(self, path=None):
+        self.path = path if path else config.CORPUS_FILE
+        self.file = open(self.path, "rb")
+        self.mm = None
+        self.view = None
+        self.columns = {}
+        try:
+            self._open()
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self):
+        if os.fstat(self.file.fileno()).st_size < len(self.MAGIC):
+            raise ValueError(f"{self.path} is not a GmailCleaner corpus file.")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mm[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"{self.path} is not a GmailCleaner corpus file.")
+
+        header_end = self.mm.find(b"\n", len(self.MAGIC)) + 1
+        try:
+            header = json.loads(self.mm[len(self.MAGIC):header_end])
+            self.count = header["count"]
+            column_offsets = [header["columns"][name] for name in self.COLUMNS]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"{self.path} has a corrupt corpus header.")
+
+        # Vues sans copie sur les offsets et les données de chaque colonne
+        self.view = memoryview(self.mm)
+        for name, offset in zip(self.COLUMNS, column_offsets):
+            start = header_end + offset
+            data_start = start + 4 * (self.count + 1)
+            self.columns[name] = (self.view[start:data_start].cast("I"), data_start)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """
+        Release the memory map and the file.
+        """
+        # Les vues memoryview doivent être libérées avant de fermer le mmap
+        for offsets, _ in self.columns.values():
+            offsets.release()
+        self.columns = {}
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+
+    def value(self, column, index):
+        """
+        Decode a single value of a column.
+        """
+        offsets, data_start = self.columns[column]
+        return self.mm[data_start + offsets[index]:data_start + offsets[index + 1]].decode("utf-8")
+
+    def row(self, index):
+        """
+        Return the metadata of one email, in the format of `EmailManager.execute_batch_with_retry`.
+        """
+        labels = self.value("labels", index)
+        return {
+            "id": self.value("id", index),
+            "sender": self.value("sender", index),
+            "subject": self.value("subject", index),
+            "labels": labels.split(",") if labels else [],
+        }
+
+    def rows(self, start=0, stop=None):
+        """
+        Iterate over the metadata of the emails in [start, stop).
+        """
+        stop = self.count if stop is None else min(stop, self.count)
+        for index in range(start, stop):
+            yield self.row(index)
+
+    @classmethod
+    def save(cls, metadata, path=None, merge=True):
+        """
+        Write a metadata dict (message ID -> metadata) to a corpus file.
+        With `merge`, emails already in the corpus are kept and updated.
+        Returns the number of emails in the corpus.
+        """
+        path = path if path else config.CORPUS_FILE
+        records = {}
+        if merge and os.path.exists(path):
+            with cls(path) as corpus:
+                records = {meta["id"]: meta for meta in corpus.rows()}
+        records.update(metadata)
+
+        blocks, column_offsets, position = [], {}, 0
+        for name in cls.COLUMNS:
+            values = []
+            for meta in records.values():
+                value = meta.get(name, "")
+                if name == "labels":
+                    value = ",".join(value)
+                values.append(value.encode("utf-8"))
+
+            offsets = array.array("I", [0])
+            for encoded in values:
+                offsets.append(offsets[-1] + len(encoded))
+
+            block = offsets.tobytes() + b"".join(values)
+            column_offsets[name] = position
+            position += len(block)
+            blocks.append(block)
+
+        header = json.dumps({"count": len(records), "columns": column_offsets}).encode("utf-8") + b"\n"
+
+        # Écrire dans un fichier temporaire pour ne jamais laisser un corpus partiel
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(cls.MAGIC)
+            file.write(header)
+            for block in blocks:
+                file.write(block)
+        os.replace(tmp_path, path)
+        return len(records)
+
+
+def _evaluate_range(args):
+    """
+    Evaluate both rule sets on a slice of the corpus (runs in a worker process).
+    Returns (both, candidate_only, baseline_only, total).
+    """
+    path, start, stop, candidate_rules, baseline_rules = args
+    both, candidate_only, baseline_only, total = 0, 0, 0, 0
+    with MetadataCorpus(path) as corpus:
+        for meta in corpus.rows(start, stop):
+            # Découper le sujet une seule fois pour les deux jeux de règles
+            subject_tokens = tokenize(meta["subject"])
+            candidate = EmailManager.is_promo_email(candidate_rules, meta, subject_tokens)
+            baseline = EmailManager.is_promo_email(baseline_rules, meta, subject_tokens)
+            if candidate and baseline:
+                both += 1
+            elif candidate:
+                candidate_only += 1
+            elif baseline:
+                baseline_only += 1
+            total += 1
+    return both, candidate_only, baseline_only, total
+
+
+def replay(candidate_rules, baseline_rules, path=None, processes=None, chunk_size=50000):
+    """
+    Run a candidate rule set and a baseline rule set over the corpus with a process pool,
+    without any API call.
+
+    The baseline decisions are used as the reference: precision is the share of the
+    candidate's hits also flagged by the baseline, recall the share of the baseline's
+    hits still flagged by the candidate.
+    """
+    path = path if path else config.CORPUS_FILE
+    with MetadataCorpus(path) as corpus:
+        count = len(corpus)
+
+    # Compiler chaque jeu de règles une seule fois, avant de l'envoyer aux processus
+    if not isinstance(candidate_rules, DetectionRules):
+        candidate_rules = DetectionRules(*candidate_rules)
+    if not isinstance(baseline_rules, DetectionRules):
+        baseline_rules = DetectionRules(*baseline_rules)
+
+    ranges = [(path, start, start + chunk_size, candidate_rules, baseline_rules) for start in range(0, count, chunk_size)]
+    both, candidate_only, baseline_only, total = 0, 0, 0, 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for result in executor.map(_evaluate_range, ranges):
+            both += result[0]
+            candidate_only += result[1]
+            baseline_only += result[2]
+            total += result[3]
+
+    candidate_count = both + candidate_only
+    baseline_count = both + baseline_only
+    return {
+        "total": total,
+        "baseline_promotional": baseline_count,
+        "candidate_promotional": candidate_count,
+        "added": candidate_only,
+        "removed": baseline_only,
+        "precision": both / candidate_count if candidate_count else 1.0,
+        "recall": both / baseline_count if baseline_count else 1.0,
+    }
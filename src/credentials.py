@@ -0,0 +1,173 @@
+# src/credentials.py
+
+import os
+import threading
+from datetime import datetime, timezone
+
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from src.config import config
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class TokenFileLock:
+    """
+    Exclusive lock on the token file, shared by every GmailCleaner process on the machine.
+    """
+
+    def __init__(self, token_file):
+        self.lock_path = f"{token_file}.lock"
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.lock_path, "a+")
+        if os.name == "nt":
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if os.name == "nt":
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+        return False
+
+
+def save_token(creds, token_file):
+    """
+    Write the credentials to the token file atomically, so other processes never read a partial file.
+    """
+    tmp_path = f"{token_file}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(creds.to_json())
+    os.replace(tmp_path, token_file)
+
+
+class CredentialsProvider:
+    """
+    Keeps the Gmail credentials fresh for long runs.
+    A background thread refreshes the token before it expires, refreshed tokens are
+    shared through token.json (under a file lock) with other processes, and every
+    thread gets its own Gmail service object.
+    """
+
+    REFRESH_MARGIN = config.TOKEN_REFRESH_MARGIN
+
+    def __init__(self, creds, token_file=None, refresh_margin=None):
+        self.creds = creds
+        self.token_file = token_file if token_file else config.TOKEN_FILE
+        self.refresh_margin = refresh_margin if refresh_margin else self.REFRESH_MARGIN
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start refreshing the token in the background.
+        """
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the background refresh.
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def get_credentials(self):
+        """
+        Return credentials that are valid for at least the refresh margin.
+        """
+        if self.seconds_until_refresh() <= 0:
+            self.refresh()
+        return self.creds
+
+    def get_service(self):
+        """
+        Return the Gmail service of the calling thread, building it on first use.
+        httplib2 connections are not thread-safe, so services are never shared between threads.
+        """
+        service = getattr(self.local, "service", None)
+        if service is None:
+            service = build("gmail", "v1", credentials=self.get_credentials(), cache_discovery=False)
+            self.local.service = service
+        return service
+
+    def seconds_until_refresh(self, creds=None):
+        """
+        Seconds left before the token enters the refresh margin (negative if it already has).
+        """
+        creds = creds if creds else self.creds
+        if creds.expiry is None:
+            return float("inf") if creds.token else 0
+        # google-auth stocke l'expiration en UTC sans fuseau horaire
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (creds.expiry - now).total_seconds() - self.refresh_margin
+
+    def refresh(self):
+        """
+        Refresh the token, unless another thread or process already did it.
+        """
+        with self.lock, TokenFileLock(self.token_file):
+            # Un autre processus a peut-être déjà rafraîchi le jeton
+            stored = self._load_stored()
+            if stored and stored.token != self.creds.token and self.seconds_until_refresh(stored) > 0:
+                self._update(stored)
+                return
+
+            if self.seconds_until_refresh() > 0:
+                return
+
+            self.creds.refresh(Request())
+            save_token(self.creds, self.token_file)
+
+    def _update(self, stored):
+        """
+        Copy a newer token into the shared credentials object, so existing services keep working.
+        """
+        self.creds.token = stored.token
+        self.creds.expiry = stored.expiry
+        # Le refresh token peut avoir été renouvelé (rotation) ; google-auth ne l'expose qu'en lecture
+        if stored.refresh_token:
+            self.creds._refresh_token = stored.refresh_token
+
+    def _load_stored(self):
+        if not os.path.exists(self.token_file):
+            return None
+        try:
+            return Credentials.from_authorized_user_file(self.token_file, self.creds.scopes)
+        except Exception as e:
+            print(f"Error reading {self.token_file}: {e}")
+            return None
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            delay = self.seconds_until_refresh()
+            if delay > 0:
+                # Plafonner l'attente pour rester à l'heure après une mise en veille de la machine
+                self.stop_event.wait(min(delay, 60))
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Background token refresh failed: {e}")
+                self.stop_event.wait(30)
@@ -0,0 +1,93 @@
+# src/journal.py
+
+import os
+import time
+import itertools
+
+from src.config import config
+from src.utils import Utils
+
+
+# Compteur par processus : deux runs lancés dans la même seconde ont des IDs différents
+_run_counter = itertools.count(1)
+
+
+class OperationJournal:
+    """
+    Append-only log of the label changes made during a run.
+    Each line holds: operation, label ID, rule and the comma-packed message IDs.
+    """
+
+    def __init__(self, run_id=None, journal_dir=None):
+        self.journal_dir = journal_dir if journal_dir else config.JOURNAL_DIR
+        self.run_id = run_id if run_id else f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_run_counter)}"
+        self.file_path = os.path.join(self.journal_dir, f"{self.run_id}.log")
+
+    def record(self, label_id, message_ids, reasons=None, operation="add"):
+        """
+        Record that `label_id` was applied to `message_ids`.
+        `reasons` optionally maps a message ID to the rule that matched it,
+        so that a single rule's hits can be undone later.
+        """
+        if not message_ids:
+            return True
+
+        # Regrouper les IDs par règle pour n'écrire qu'une ligne par règle
+        groups = {}
+        for message_id in message_ids:
+            rule = reasons.get(message_id, "") if reasons else ""
+            groups.setdefault(rule, []).append(message_id)
+
+        content = "".join(
+            f"{operation}\t{label_id}\t{rule}\t{','.join(ids)}\n"
+            for rule, ids in groups.items()
+        )
+        return Utils.write_to_file(self.file_path, content)
+
+    def entries(self, rule=None):
+        """
+        Return the recorded entries as (operation, label_id, rule, message_ids) tuples.
+        `rule` keeps only one rule's hits: either an exact rule ("sender:noreply")
+        or a rule type ("sender").
+        """
+        entries = []
+        for line in Utils.read_file(self.file_path):
+            parts = line.split("\t")
+            if len(parts) != 4:
+                continue
+            operation, label_id, entry_rule, packed_ids = parts
+            if rule and entry_rule != rule and entry_rule.split(":", 1)[0] != rule:
+                continue
+            entries.append((operation, label_id, entry_rule, packed_ids.split(",")))
+        return entries
+
+    def undo_batches(self, rule=None, batch_size=None):
+        """
+        Replay the journal in reverse and group the message IDs of each label
+        into batches of at most `batch_size` IDs.
+        Returns a list of (label_id, message_ids) tuples.
+        """
+        batch_size = batch_size if batch_size else config.MAX_BATCH_MODIFY
+        pending = {}
+        for operation, label_id, _, message_ids in reversed(self.entries(rule)):
+            if operation != "add":
+                continue
+            pending.setdefault(label_id, {}).update(dict.fromkeys(reversed(message_ids)))
+
+        batches = []
+        for label_id, ids in pending.items():
+            ids = list(ids)
+            for i in range(0, len(ids), batch_size):
+                batches.append((label_id, ids[i:i + batch_size]))
+        return batches
+
+    @staticmethod
+    def list_runs(journal_dir=None):
+        """
+        List the run IDs that have a journal, most recent first.
+        """
+        journal_dir = journal_dir if journal_dir else config.JOURNAL_DIR
+        if not os.path.isdir(journal_dir):
+            return []
+        runs = [name[:-len(".log")] for name in os.listdir(journal_dir) if name.endswith(".log")]
+        return sorted(runs, reverse=True)
@@ -0,0 +1,188 @@
+# src/lexicon.py
+
+import os
+import re
+import unicodedata
+
+from src.config import config
+from src.utils import Utils
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def fold(text):
+    """
+    Lowercase a text and strip its accents ("Réduction" -> "reduction").
+    """
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(token):
+    """
+    Strip simple plural endings, so that "deals", "offres" or "cadeaux"
+    match the "deal", "offre" and "cadeau" keywords.
+    """
+    if len(token) > 3:
+        if token.endswith("eaux"):
+            return token[:-1]
+        if token.endswith("s") and not token.endswith("ss"):
+            return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """
+    Split a text into folded and stemmed word tokens.
+    """
+    return [stem(token) for token in TOKEN_PATTERN.findall(fold(text))]
+
+
+class KeywordLexicon:
+    """
+    Weighted promotional keywords, compiled once into hash-set lookups on word tokens.
+    Multi-word keywords ("bon plan") are matched on consecutive tokens,
+    so "off" matches "50% off" but not "office", and "deal" matches "deals".
+    """
+
+    def __init__(self, entries, languages=None, source="keyword"):
+        """
+        Args:
+            entries: List of (keyword, weight, language) tuples
+            languages: Languages to keep (optional, all by default)
+            source: Rule type reported for these keywords ("keyword", "subject"...)
+        """
+        self.phrases = {}
+        self.sources = {}
+        self.max_length = 0
+        # Premiers tokens des mots-clés, pour ignorer rapidement les mots sans intérêt
+        self.first_tokens = set()
+
+        for keyword, weight, language in entries:
+            if languages and language and language not in languages:
+                continue
+            self._add(keyword, weight, source)
+
+    def _add(self, keyword, weight, source, replace=True):
+        tokens = tuple(tokenize(keyword))
+        if not tokens:
+            return
+        if tokens in self.phrases:
+            # En cas de doublon, garder le poids le plus élevé
+            if not replace or self.phrases[tokens][0] >= weight:
+                return
+        self.phrases[tokens] = (weight, keyword)
+        self.sources[keyword] = source
+        self.first_tokens.add(tokens[0])
+        self.max_length = max(self.max_length, len(tokens))
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def merged(self, phrases, source, weight=1.0):
+        """
+        Return a copy of this lexicon with extra phrases (e.g. the subject rules) added.
+        Phrases already in the lexicon keep the lexicon's weight.
+        """
+        lexicon = KeywordLexicon([])
+        lexicon.phrases = dict(self.phrases)
+        lexicon.sources = dict(self.sources)
+        lexicon.first_tokens = set(self.first_tokens)
+        lexicon.max_length = self.max_length
+        for phrase in phrases:
+            lexicon._add(phrase, weight, source, replace=False)
+        return lexicon
+
+    def source(self, keyword):
+        """
+        Rule type of a keyword, as given when it was added.
+        """
+        return self.sources.get(keyword, "keyword")
+
+    def matches_tokens(self, tokens):
+        """
+        Return the keywords found in a list of tokens, as a dict keyword -> weight.
+        At each position only the longest keyword counts, so "free shipping" does not also count "free".
+        """
+        found = {}
+        first_tokens = self.first_tokens
+        i = 0
+        while i < len(tokens):
+            if tokens[i] in first_tokens:
+                for length in range(min(self.max_length, len(tokens) - i), 0, -1):
+                    match = self.phrases.get(tuple(tokens[i:i + length]))
+                    if match:
+                        weight, keyword = match
+                        found[keyword] = weight
+                        i += length
+                        break
+                else:
+                    i += 1
+            else:
+                i += 1
+        return found
+
+    def matches(self, text):
+        """
+        Return the keywords found in a text, as a dict keyword -> weight.
+        """
+        return self.matches_tokens(tokenize(text))
+
+    def score_tokens(self, tokens):
+        """
+        Sum the weights of the distinct keywords found in a list of tokens.
+        Returns a tuple (score, best_keyword), best_keyword being None if nothing matched.
+        """
+        found = self.matches_tokens(tokens)
+        if not found:
+            return 0.0, None
+        return sum(found.values()), max(found, key=found.get)
+
+    def score(self, text):
+        """
+        Sum the weights of the distinct keywords found in a text.
+        Returns a tuple (score, best_keyword), best_keyword being None if nothing matched.
+        """
+        return self.score_tokens(tokenize(text))
+
+    @classmethod
+    def from_file(cls, file_path=None, languages=None):
+        """
+        Load a lexicon from a file with one "keyword;weight;language" entry per line.
+        Weight and language are optional; lines starting with "#" are ignored.
+        """
+        file_path = file_path if file_path else config.PROMOTIONAL_KEYWORDS_FILE
+        languages = languages if languages else config.KEYWORD_LANGUAGES
+
+        entries = []
+        for line in Utils.read_file(file_path):
+            if line.startswith("#"):
+                continue
+            parts = [part.strip() for part in line.split(";")]
+            try:
+                weight = float(parts[1]) if len(parts) > 1 and parts[1] else 1.0
+            except ValueError:
+                print(f"Invalid keyword weight in {file_path}: {line}")
+                continue
+            language = parts[2] if len(parts) > 2 else ""
+            entries.append((parts[0], weight, language))
+        return cls(entries, languages)
+
+
+_cache = {}
+
+
+def get_lexicon(file_path=None):
+    """
+    Return the compiled lexicon of a keyword file, recompiled only when the file changes.
+    """
+    file_path = file_path if file_path else config.PROMOTIONAL_KEYWORDS_FILE
+    mtime = os.path.getmtime(file_path) if os.path.exists(file_path) else None
+    cached = _cache.get(file_path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, KeywordLexicon.from_file(file_path))
+        _cache[file_path] = cached
+    return cached[1]
@@ -40,6 +40,12 @@ def main():
                 console.show_statistics()
             elif choice == "5":
                 console.test_gmail_connection()
+            elif choice == "6":
+                console.manage_distributed_processing()
+            elif choice == "7":
+                console.undo_run()
+            elif choice == "8":
+                console.replay_rules()
             
             # Pause before returning to the menu
             if choice != "0":
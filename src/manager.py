@@ -6,7 +6,9 @@ import random
 from src.config import config
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn, SpinnerColumn
+from src.progress import ProgressSink
+from src.lexicon import tokenize
+from src.rules import DetectionRules
 
 class EmailManager:
     """
@@ -15,10 +17,21 @@ class EmailManager:
 
     BATCH_SIZE = config.BATCH_SIZE
 
-    def __init__(self, creds, label_name=None):
+    def __init__(self, creds, label_name=None, progress=None, credentials=None):
         self.creds = creds
         self.label_name = label_name if label_name else config.TARGET_FOLDER
-        self.service = build("gmail", "v1", credentials=creds)
+        self.progress = progress if progress else ProgressSink()
+        self.credentials = credentials
+        self._service = None if credentials else build("gmail", "v1", credentials=creds)
+
+    @property
+    def service(self):
+        """
+        Gmail service of the calling thread when a CredentialsProvider is used, else a single shared service.
+        """
+        if self.credentials is not None:
+            return self.credentials.get_service()
+        return self._service
 
     def get_emails_ids(self):
         """
@@ -32,6 +45,33 @@ class EmailManager:
             print(f"An HTTP error occurred while getting unread emails: {error}")
             return []
     
+    def get_all_emails_ids(self, page_size=500):
+        """
+        Retrieve every email not yet labeled, following the pages of the Gmail API.
+        Returns a list of message IDs.
+        """
+        messages = []
+        page_token = None
+        query = f"-label:{self.label_name}"
+        try:
+            while True:
+                def execute_request():
+                    return self.service.users().messages().list(
+                        userId="me",
+                        maxResults=page_size,
+                        q=query,
+                        pageToken=page_token
+                    ).execute()
+
+                results = self.__class__.api_request_with_retry(execute_request)
+                messages.extend(results.get("messages", []))
+                page_token = results.get("nextPageToken")
+                if not page_token:
+                    return messages
+        except HttpError as error:
+            print(f"An HTTP error occurred while listing emails: {error}")
+            return messages
+
     @staticmethod
     def api_request_with_retry(request_func, max_retries=5, base_delay=1):
         """
@@ -58,46 +98,26 @@ class EmailManager:
         
     def batch_get_email_metadata(self, message_ids, progress=None, progress_task=None, max_retries=5, batch_size=BATCH_SIZE):
         """
-        Récupère les métadonnées en lot avec possibilité de passer une barre de progression externe
+        Récupère les métadonnées en lot en émettant la progression vers un ProgressSink
         Args:
             message_ids: Liste des IDs de messages
-            progress: Instance Progress existante (optionnelle)
-            progress_task: ID de tâche dans l'instance Progress (optionnel)
+            progress: ProgressSink à utiliser (optionnel, celui du manager par défaut)
+            progress_task: Tâche existante dans ce ProgressSink (optionnelle)
             max_retries: Nombre maximum de tentatives
             batch_size: Taille des lots
         """
         results = {}
         total_messages = len(message_ids)
-        
-        # Si aucune barre de progression n'est fournie, en créer une nouvelle
-        if progress is None:
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[bold blue]{task.description}[/bold blue]"),
-                BarColumn(bar_width=40),
-                TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                TextColumn("({task.completed}/{task.total})"),
-                TimeRemainingColumn(),
-            ) as local_progress:
-                task = local_progress.add_task("[green]Retrieving metadata...", total=total_messages)
-                for i in range(0, total_messages, batch_size):
-                    chunk = message_ids[i:i + batch_size]
-                    batch_results = self.execute_batch_with_retry(chunk, max_retries)
-                    results.update(batch_results)
-                    local_progress.update(task, advance=len(chunk))
-                    adaptive_delay = min(5, 1 + (i / total_messages) * 2)
-                    time.sleep(adaptive_delay)
-        # Sinon, utiliser la barre de progression fournie
-        else:
-            for i in range(0, total_messages, batch_size):
-                chunk = message_ids[i:i + batch_size]
-                batch_results = self.execute_batch_with_retry(chunk, max_retries)
-                results.update(batch_results)
-                if progress is not None and progress_task is not None:
-                    # Assurez-vous que progress_task est bien un ID de tâche (int) et non une fonction
-                    progress.update(progress_task, advance=len(chunk))
-                adaptive_delay = min(5, 1 + (i / total_messages) * 2)
-                time.sleep(adaptive_delay)
+        progress = progress if progress else self.progress
+        task = progress_task if progress_task is not None else progress.add_task("[green]Retrieving metadata...", total_messages)
+
+        for i in range(0, total_messages, batch_size):
+            chunk = message_ids[i:i + batch_size]
+            batch_results = self.execute_batch_with_retry(chunk, max_retries)
+            results.update(batch_results)
+            progress.advance(task, len(chunk))
+            adaptive_delay = min(5, 1 + (i / total_messages) * 2)
+            time.sleep(adaptive_delay)
                 
         return results
     
@@ -150,64 +170,72 @@ class EmailManager:
         self.__class__.api_request_with_retry(execute_request, max_retries)
         return batch_results
     
-    def is_promo_email(self, rules, meta):
+    @staticmethod
+    def is_promo_email(rules, meta, subject_tokens=None):
         """
-        Check if an email is promotional based on sender, subject, or domain.
-        Returns a tuple (is_promotional, reason)
+        Check if an email is promotional based on sender, subject, domain, or keywords.
+        Returns True if the email is promotional, False otherwise.
+        """
+        return EmailManager.get_promo_reason(rules, meta, subject_tokens) is not None
+
+    @staticmethod
+    def get_promo_reason(rules, meta, subject_tokens=None):
+        """
+        Find the rule that makes an email promotional.
+        `rules` is a DetectionRules, or a list of senders, subjects, domains and optionally a KeywordLexicon
+        (compiled on every call, so prefer DetectionRules in loops).
+        `subject_tokens` lets callers tokenize a subject once when checking it against several rule sets.
+        Returns the rule as "<type>:<value>" (e.g. "sender:noreply"), or None.
         """
         try:
             # Vérifier que meta est bien un dictionnaire
             if not isinstance(meta, dict):
                 print(f"Warning: meta is not a dictionary: {meta}")
-                return False
+                return None
+
+            if not isinstance(rules, DetectionRules):
+                rules = DetectionRules(*rules)
                 
             sender = meta.get("sender", "").lower()
-            subject = meta.get("subject", "").lower()
             labels = meta.get("labels", [])
 
-            promotional_senders = [s.lower() for s in rules[0]]
-            promotional_subjects = [s.lower() for s in rules[1]]
-            promotional_domains = [s.lower() for s in rules[2]]
-
             # Extraire le domaine de l'email
             domain = ""
             if sender and "@" in sender:
                 domain = sender.split("@")[-1].split(">")[0].lower()
 
             # Vérification par expéditeur
-            for promo_sender in promotional_senders:
-                if promo_sender and promo_sender in sender:
-                    return True
-
-            # Vérification par sujet
-            for promo_subject in promotional_subjects:
-                if promo_subject and promo_subject in subject:
-                    return True
+            for promo_sender in rules.senders:
+                if promo_sender in sender:
+                    return f"sender:{promo_sender}"
 
             # Vérification par domaine
-            for promo_domain in promotional_domains:
-                if promo_domain and domain and promo_domain in domain:
-                    return True
+            for promo_domain in rules.domains:
+                if domain and promo_domain in domain:
+                    return f"domain:{promo_domain}"
 
             # Vérification par label Gmail
             if "CATEGORY_PROMOTIONS" in labels:
-                return True
+                return "label:CATEGORY_PROMOTIONS"
                 
-            # Vérifier les mots-clés communs de promotion dans le sujet
-            promo_keywords = ["offre", "promo", "discount", "sale", "deal", "newsletter", 
-                            "special", "coupon", "off", "save", "free", "gratuit"]
-            for keyword in promo_keywords:
-                if keyword in subject:
-                    return True
+            # Mots-clés et règles de sujet, pondérés dans un même score (mots entiers, sans accents)
+            if subject_tokens is None:
+                subject_tokens = tokenize(meta.get("subject", ""))
+            score, keyword = rules.lexicon.score_tokens(subject_tokens)
+            if score >= config.KEYWORD_THRESHOLD:
+                return f"{rules.lexicon.source(keyword)}:{keyword.lower()}"
 
-            return False
+            return None
         except Exception as e:
             print(f"An error occurred while checking for promotion email: {e}")
-            return False
+            return None
         
-    def batch_apply_label(self, email_ids, label_name=None, progress=None, progress_task=None, batch_size=BATCH_SIZE):
+    def batch_apply_label(self, email_ids, label_name=None, progress=None, progress_task=None, batch_size=BATCH_SIZE, journal=None, reasons=None):
         """
         Apply a label to a batch of email IDs.
+        If a journal is given, every batch is recorded in it before being applied so the run can be undone,
+        with `reasons` mapping each message ID to the rule that matched it.
+        Labeling stops, without touching the batch, if the journal cannot be written.
         Returns True if successful, False otherwise.
         """
         if label_name is None:
@@ -219,83 +247,87 @@ class EmailManager:
             print(f"Label '{label_name}' couldn't be created or found.")
             return False
         
-        if not progress:
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[bold blue]{task.description}[/bold blue]"),
-                BarColumn(bar_width=40),
-                TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
-                TextColumn("({task.completed}/{task.total})"),
-                TimeRemainingColumn(),
-            ) as progress:
-                task = progress.add_task("[green]Applying labels...", total=len(email_ids))
+        progress = progress if progress else self.progress
+        task = progress_task if progress_task is not None else progress.add_task("[green]Applying labels...", len(email_ids))
+
+        for i in range(0, len(email_ids), batch_size):
+            chunk = email_ids[i:i + batch_size]
+            chunk_ids = [msg["id"] for msg in chunk if isinstance(msg, dict) and "id" in msg]
+            
+            if not chunk_ids:
+                progress.advance(task, len(chunk))
+                continue
+            
+            def execute_request():
+                return self.service.users().messages().batchModify(
+                    userId="me",
+                    body={
+                        "ids": chunk_ids,
+                        "addLabelIds": [label_id]
+                    }
+                ).execute()
+            
+            # Journaliser avant de modifier (write-ahead) : retirer un label jamais appliqué est sans effet
+            if journal is not None and not journal.record(label_id, chunk_ids, reasons):
+                print(f"Could not write the undo journal {journal.file_path}. "
+                      f"Stopping before batch {i}: the remaining emails are left unchanged.")
+                return False
+
+            try:
+                # Utiliser correctement la méthode statique
+                self.__class__.api_request_with_retry(execute_request)
+                progress.advance(task, len(chunk))
                 
-                for i in range(0, len(email_ids), batch_size):
-                    chunk = email_ids[i:i + batch_size]
-                    chunk_ids = [msg["id"] for msg in chunk if isinstance(msg, dict) and "id" in msg]
-                    
-                    if not chunk_ids:
-                        progress.update(task, advance=len(chunk))
-                        continue
-                    
-                    def execute_request():
-                        return self.service.users().messages().batchModify(
-                            userId="me",
-                            body={
-                                "ids": chunk_ids,
-                                "addLabelIds": [label_id]
-                            }
-                        ).execute()
-                    
-                    try:
-                        # Utiliser correctement la méthode statique
-                        self.__class__.api_request_with_retry(execute_request)
-                        progress.update(task, advance=len(chunk))
-                        
-                        # Délai adaptatif pour éviter les limitations de l'API
-                        adaptive_delay = 1 + random.uniform(0.5, 1.5)
-                        time.sleep(adaptive_delay)
-                        
-                    except Exception as e:
-                        print(f"Error applying label to batch {i}: {e}")
-                        # Continuer avec le batch suivant au lieu de terminer immédiatement
-                        progress.update(task, advance=len(chunk))
-        
-            # Si nous arrivons ici, tout s'est bien passé
-            return True
-        else:
-            if progress is not None and progress_task is not None:
-                for i in range(0, len(email_ids), batch_size):
-                    chunk = email_ids[i:i + batch_size]
-                    chunk_ids = [msg["id"] for msg in chunk if isinstance(msg, dict) and "id" in msg]
-                    
-                    if not chunk_ids:
-                        progress.update(progress_task, advance=len(chunk))
-                        continue
-                    
-                    def execute_request():
-                        return self.service.users().messages().batchModify(
-                            userId="me",
-                            body={
-                                "ids": chunk_ids,
-                                "addLabelIds": [label_id]
-                            }
-                        ).execute()
-                    
-                    try:
-                        # Utiliser correctement la méthode statique
-                        self.__class__.api_request_with_retry(execute_request)
-                        progress.update(progress_task, advance=len(chunk))
-                        
-                        # Délai adaptatif pour éviter les limitations de l'API
-                        adaptive_delay = 1 + random.uniform(0.5, 1.5)
-                        time.sleep(adaptive_delay)
-                        
-                    except Exception as e:
-                        print(f"Error applying label to batch {i}: {e}")
-                        # Continuer avec le batch suivant au lieu de terminer immédiatement
-                        progress.update(progress_task, advance=len(chunk))
-                return True
+                # Délai adaptatif pour éviter les limitations de l'API
+                adaptive_delay = 1 + random.uniform(0.5, 1.5)
+                time.sleep(adaptive_delay)
+                
+            except Exception as e:
+                print(f"Error applying label to batch {i}: {e}")
+                # Continuer avec le batch suivant au lieu de terminer immédiatement
+                progress.advance(task, len(chunk))
+
+        return True
+
+    def batch_remove_label(self, label_id, message_ids, batch_size=config.MAX_BATCH_MODIFY):
+        """
+        Remove a label from a list of message IDs, using batches of at most 1000 IDs.
+        Returns the number of messages successfully updated.
+        """
+        removed = 0
+        for i in range(0, len(message_ids), batch_size):
+            chunk_ids = message_ids[i:i + batch_size]
+
+            def execute_request():
+                return self.service.users().messages().batchModify(
+                    userId="me",
+                    body={
+                        "ids": chunk_ids,
+                        "removeLabelIds": [label_id]
+                    }
+                ).execute()
+
+            try:
+                self.__class__.api_request_with_retry(execute_request)
+                removed += len(chunk_ids)
+
+                # Délai adaptatif pour éviter les limitations de l'API
+                adaptive_delay = 1 + random.uniform(0.5, 1.5)
+                time.sleep(adaptive_delay)
+
+            except Exception as e:
+                print(f"Error removing label from batch {i}: {e}")
+        return removed
+
+    def undo_run(self, journal, rule=None):
+        """
+        Undo the label changes recorded in a journal, optionally for a single rule.
+        Returns the number of messages restored.
+        """
+        restored = 0
+        for label_id, message_ids in journal.undo_batches(rule):
+            restored += self.batch_remove_label(label_id, message_ids)
+        return restored
 
     def get_label_id(self):
         """
@@ -0,0 +1,160 @@
+# src/progress.py
+
+import sys
+import json
+import time
+
+from rich.progress import Progress, TextColumn, BarColumn, TimeRemainingColumn, SpinnerColumn
+
+
+class ProgressSink:
+    """
+    Receives progress events emitted by EmailManager.
+    The base class ignores every event, so hot loops pay almost nothing when nobody listens.
+    """
+
+    def add_task(self, description, total):
+        """
+        Start a new task and return its handle.
+        """
+        return None
+
+    def advance(self, task, amount=1):
+        """
+        Report that `amount` more items of `task` are done.
+        """
+
+    def complete(self, task):
+        """
+        Mark `task` as finished.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class ThrottledProgressSink(ProgressSink):
+    """
+    Accumulates advances and only flushes them `refresh_per_second` times per second.
+    """
+
+    def __init__(self, refresh_per_second=10):
+        self.interval = 1 / refresh_per_second
+        self.tasks = {}
+        self.pending = {}
+        self.last_flush = 0.0
+
+    def add_task(self, description, total):
+        task = self._start(description, total)
+        self.tasks[task] = {"description": description, "total": total, "completed": 0}
+        self.pending[task] = 0
+        return task
+
+    def advance(self, task, amount=1):
+        self.pending[task] += amount
+        now = time.monotonic()
+        if now - self.last_flush >= self.interval:
+            self.last_flush = now
+            self.flush()
+
+    def complete(self, task):
+        self.flush()
+        state = self.tasks[task]
+        state["completed"] = state["total"]
+        self._complete(task, state)
+
+    def flush(self):
+        """
+        Send the accumulated advances to the renderer.
+        """
+        for task, amount in self.pending.items():
+            if amount:
+                state = self.tasks[task]
+                state["completed"] += amount
+                self.pending[task] = 0
+                self._update(task, state, amount)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+    def _start(self, description, total):
+        """
+        Create the task in the renderer and return its handle (renderers override the hooks below).
+        """
+        return len(self.tasks)
+
+    def _update(self, task, state, amount):
+        """
+        Render accumulated progress of a task.
+        """
+
+    def _complete(self, task, state):
+        """
+        Render the end of a task.
+        """
+
+
+class RichProgressSink(ThrottledProgressSink):
+    """
+    Renders progress events with a rich Progress display.
+    """
+
+    def __init__(self, progress=None, refresh_per_second=10):
+        super().__init__(refresh_per_second)
+        self.progress = progress if progress else Progress(
+            SpinnerColumn(),
+            TextColumn("[bold blue]{task.description}[/bold blue]"),
+            BarColumn(bar_width=40),
+            TextColumn("[progress.percentage]{task.percentage:>3.0f}%"),
+            TextColumn("({task.completed}/{task.total})"),
+            TimeRemainingColumn(),
+            refresh_per_second=refresh_per_second,
+        )
+
+    def _start(self, description, total):
+        return self.progress.add_task(description, total=total)
+
+    def _update(self, task, state, amount):
+        self.progress.update(task, advance=amount)
+
+    def _complete(self, task, state):
+        self.progress.update(task, completed=state["total"])
+
+    def __enter__(self):
+        self.progress.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        return self.progress.__exit__(exc_type, exc_value, traceback)
+
+
+class JsonLinesProgressSink(ThrottledProgressSink):
+    """
+    Writes progress events as JSON lines, for headless runs.
+    """
+
+    def __init__(self, stream=None, refresh_per_second=1):
+        super().__init__(refresh_per_second)
+        self.stream = stream if stream else sys.stderr
+        self.next_task = 0
+
+    def _start(self, description, total):
+        task = self.next_task
+        self.next_task += 1
+        self._emit("start", task, {"description": description, "total": total, "completed": 0})
+        return task
+
+    def _update(self, task, state, amount):
+        self._emit("progress", task, state)
+
+    def _complete(self, task, state):
+        self._emit("complete", task, state)
+
+    def _emit(self, event, task, state):
+        self.stream.write(json.dumps({"event": event, "task": task, "time": time.time(), **state}) + "\n")
+        self.stream.flush()
@@ -0,0 +1,45 @@
+# src/rules.py
+
+import os
+
+from src.config import config
+from src.utils import Utils
+from src.lexicon import KeywordLexicon, get_lexicon
+
+
+class DetectionRules:
+    """
+    Detection rules compiled once per run: lowercased sender and domain patterns,
+    and a single weighted lexicon holding the keywords and the subject rules.
+    """
+
+    def __init__(self, senders, subjects, domains, lexicon=None):
+        """
+        Args:
+            senders: Promotional sender patterns
+            subjects: Promotional subject phrases, scored with a weight of 1 unless the lexicon defines them
+            domains: Promotional domain patterns
+            lexicon: KeywordLexicon (optional, the keywords file by default)
+        """
+        self.senders = tuple(s.lower() for s in senders if s)
+        self.subjects = tuple(subjects)
+        self.domains = tuple(s.lower() for s in domains if s)
+        lexicon = lexicon if lexicon is not None else get_lexicon()
+        self.lexicon = lexicon.merged(self.subjects, source="subject")
+
+    @classmethod
+    def load(cls, rules_dir=None):
+        """
+        Load the rules from the rule files, or from the same files in another directory.
+        """
+        rule_files = [
+            config.PROMOTIONAL_SENDERS_FILE,
+            config.PROMOTIONAL_SUBJECTS_FILE,
+            config.PROMOTIONAL_DOMAINS_FILE,
+            config.PROMOTIONAL_KEYWORDS_FILE,
+        ]
+        if rules_dir:
+            rule_files = [os.path.join(rules_dir, os.path.basename(file_path)) for file_path in rule_files]
+
+        senders, subjects, domains = (Utils.read_file(file_path) for file_path in rule_files[:3])
+        return cls(senders, subjects, domains, KeywordLexicon.from_file(rule_files[3]))
@@ -0,0 +1,118 @@
+# tests/test_coordinator.py
+
+import time
+import multiprocessing
+
+import pytest
+
+from src.coordinator import ShardCoordinator, run_worker
+
+
+class FakeManager:
+    """
+    Stands in for EmailManager: every third message is promotional, no API call is made.
+    """
+
+    def __init__(self):
+        self.labeled = []
+
+    def batch_get_email_metadata(self, message_ids):
+        return {m["id"]: {"id": m["id"], "subject": "promo" if int(m["id"]) % 3 == 0 else "hello"} for m in message_ids}
+
+    def get_promo_reason(self, rules, meta):
+        return "keyword:promo" if meta.get("subject") == "promo" else None
+
+    def batch_apply_label(self, email_ids, journal=None, reasons=None):
+        self.labeled.extend(m["id"] for m in email_ids)
+        return True
+
+
+def _worker(db_path, worker_id):
+    return run_worker(FakeManager(), None, ShardCoordinator(db_path), worker_id=worker_id)
+
+
+def test_workers_process_every_unit_once(tmp_path):
+    db_path = str(tmp_path / "coordinator.db")
+    coordinator = ShardCoordinator(db_path)
+    assert coordinator.create_units([str(i) for i in range(2000)], unit_size=10) == 200
+
+    with multiprocessing.Pool(4) as pool:
+        completed = pool.starmap(_worker, [(db_path, f"worker-{i}") for i in range(4)])
+
+    report = coordinator.aggregate_report()
+    assert sum(completed) == 200
+    assert report["units_done"] == 200
+    assert report["units_pending"] == 0 and report["units_leased"] == 0
+    assert report["processed"] == 2000
+    assert report["promotional"] == len([i for i in range(2000) if i % 3 == 0])
+
+
+def test_create_units_skips_queued_ids(tmp_path):
+    coordinator = ShardCoordinator(str(tmp_path / "coordinator.db"))
+    assert coordinator.create_units([{"id": str(i)} for i in range(50)], unit_size=10) == 5
+    assert coordinator.create_units([{"id": str(i)} for i in range(60)], unit_size=10) == 1
+
+    run_worker(FakeManager(), None, coordinator, worker_id="worker")
+    assert coordinator.aggregate_report()["processed"] == 60
+
+
+def test_expired_lease_is_reassigned(tmp_path):
+    coordinator = ShardCoordinator(str(tmp_path / "coordinator.db"), lease_duration=0.2)
+    coordinator.create_units(["1", "2", "3"], unit_size=10)
+
+    unit_id, _ = coordinator.claim_unit("stalled")
+    assert coordinator.claim_unit("other") is None
+
+    time.sleep(0.3)
+    assert coordinator.claim_unit("other")[0] == unit_id
+
+    # Le worker bloqué a perdu son bail : ni renouvellement ni validation
+    assert not coordinator.renew_lease(unit_id, "stalled")
+    assert not coordinator.complete_unit(unit_id, "stalled", 3, [])
+    assert coordinator.complete_unit(unit_id, "other", 3, ["3"])
+
+    report = coordinator.aggregate_report()
+    assert report["units_done"] == 1
+    assert report["workers"] == {"other": {"units": 1, "processed": 3, "promotional": 1}}
+
+
+class FailingManager(FakeManager):
+    """
+    Fails on metadata retrieval, like a non-retried HttpError.
+    """
+
+    def batch_get_email_metadata(self, message_ids):
+        raise RuntimeError("HTTP 500")
+
+
+def test_failed_unit_is_released_immediately(tmp_path):
+    coordinator = ShardCoordinator(str(tmp_path / "coordinator.db"))
+    coordinator.create_units(["1", "2", "3"], unit_size=10)
+
+    with pytest.raises(RuntimeError):
+        run_worker(FailingManager(), None, coordinator, worker_id="failing")
+
+    # L'unité est de nouveau disponible sans attendre l'expiration du bail
+    assert coordinator.aggregate_report()["units_pending"] == 1
+    assert run_worker(FakeManager(), None, coordinator, worker_id="other") == 1
+
+
+class UnjournaledManager(FakeManager):
+    """
+    batch_apply_label fails, like EmailManager when the undo journal cannot be written.
+    """
+
+    def batch_apply_label(self, email_ids, journal=None, reasons=None):
+        return False
+
+
+def test_worker_stops_when_labeling_fails(tmp_path):
+    coordinator = ShardCoordinator(str(tmp_path / "coordinator.db"))
+    coordinator.create_units([str(i) for i in range(30)], unit_size=10)
+
+    assert run_worker(UnjournaledManager(), None, coordinator, worker_id="worker", dry_run=False) == 0
+
+    # Le worker s'arrête à la première unité, qui retourne dans la file sans être validée
+    report = coordinator.aggregate_report()
+    assert report["units_done"] == 0
+    assert report["units_pending"] == 3
@@ -0,0 +1,62 @@
+# tests/test_corpus.py
+
+import pytest
+
+from src.corpus import MetadataCorpus, replay
+from src.lexicon import KeywordLexicon
+from src.rules import DetectionRules
+
+
+def meta(message_id, subject, sender="bob@corp.com", labels=()):
+    return {"id": message_id, "sender": sender, "subject": subject, "labels": list(labels)}
+
+
+def test_save_reopen_and_merge(tmp_path):
+    path = str(tmp_path / "corpus.bin")
+    first = {"a": meta("a", "Réduction été", labels=["INBOX", "CATEGORY_PROMOTIONS"]), "b": meta("b", "Hello")}
+    assert MetadataCorpus.save(first, path) == 2
+
+    with MetadataCorpus(path) as corpus:
+        assert len(corpus) == 2
+        assert list(corpus.rows()) == list(first.values())
+
+    # Une nouvelle sauvegarde met à jour "b" et ajoute "c" sans perdre "a"
+    assert MetadataCorpus.save({"b": meta("b", "Hello again"), "c": meta("c", "")}, path) == 3
+    with MetadataCorpus(path) as corpus:
+        assert {row["id"]: row for row in corpus.rows()} == {
+            "a": first["a"],
+            "b": meta("b", "Hello again"),
+            "c": meta("c", ""),
+        }
+
+
+@pytest.mark.parametrize("content", [b"", b"not a corpus", MetadataCorpus.MAGIC + b"{broken\n"])
+def test_invalid_corpus_raises_value_error(tmp_path, content):
+    path = tmp_path / "corpus.bin"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        MetadataCorpus(str(path))
+
+
+def test_replay_reports_precision_and_recall_against_baseline(tmp_path):
+    path = str(tmp_path / "corpus.bin")
+    MetadataCorpus.save({
+        "1": meta("1", "Big sale today"),
+        "2": meta("2", "Weekly newsletter"),
+        "3": meta("3", "Coupon inside"),
+        "4": meta("4", "Meeting notes"),
+    }, path)
+
+    empty = KeywordLexicon([])
+    baseline = DetectionRules([], [], [], KeywordLexicon([("sale", 1, "en"), ("newsletter", 1, "en")]))
+    candidate = DetectionRules([], [], [], KeywordLexicon([("sale", 1, "en"), ("coupon", 1, "en")]))
+
+    report = replay(candidate, baseline, path=path, processes=2, chunk_size=2)
+    assert report["total"] == 4
+    assert report["baseline_promotional"] == 2
+    assert report["candidate_promotional"] == 2
+    assert report["added"] == 1 and report["removed"] == 1
+    assert report["precision"] == 0.5 and report["recall"] == 0.5
+
+    # Des listes brutes sont compilées une fois avant l'envoi aux processus
+    assert replay([[], [], [], empty], [[], [], [], empty], path=path, processes=1)["candidate_promotional"] == 0
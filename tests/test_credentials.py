@@ -0,0 +1,105 @@
+# tests/test_credentials.py
+
+import json
+import time
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from google.oauth2.credentials import Credentials
+
+from src import credentials
+from src.credentials import CredentialsProvider
+
+SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+
+
+def utcnow():
+    # google-auth stocke l'expiration en UTC sans fuseau horaire
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class FakeCredentials(Credentials):
+    """
+    Credentials whose refresh hands out a new token locally instead of calling Google.
+    """
+
+    def __init__(self, token, expiry, refresh_token="refresh-0"):
+        super().__init__(token, refresh_token=refresh_token, token_uri="https://oauth2.example/token",
+                         client_id="client", client_secret="secret", scopes=SCOPES)
+        self.expiry = expiry
+        self.refresh_calls = 0
+
+    def refresh(self, request):
+        self.refresh_calls += 1
+        self.token = f"token-{self.refresh_calls}"
+        self.expiry = utcnow() + timedelta(hours=1)
+        self._refresh_token = f"refresh-{self.refresh_calls}"
+
+
+@pytest.fixture(autouse=True)
+def fake_google(monkeypatch):
+    # Aucun appel réseau : Request et build sont remplacés par des objets factices
+    monkeypatch.setattr(credentials, "Request", lambda: None)
+    monkeypatch.setattr(credentials, "build", lambda *args, **kwargs: object())
+
+
+def test_background_thread_refreshes_expiring_token(tmp_path):
+    token_file = str(tmp_path / "token.json")
+    creds = FakeCredentials("token-0", utcnow() + timedelta(seconds=10))
+    provider = CredentialsProvider(creds, token_file=token_file, refresh_margin=300)
+
+    provider.start()
+    try:
+        deadline = time.time() + 5
+        while creds.refresh_calls == 0 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        provider.stop()
+
+    assert creds.refresh_calls == 1
+    assert provider.seconds_until_refresh() > 0
+    # Le jeton rafraîchi est partagé avec les autres processus, sans fichier temporaire résiduel
+    with open(token_file) as file:
+        stored = json.load(file)
+    assert stored["token"] == "token-1" and stored["refresh_token"] == "refresh-1"
+    assert not (tmp_path / "token.json.tmp").exists()
+
+
+def test_refresh_skipped_when_another_process_already_refreshed(tmp_path):
+    token_file = str(tmp_path / "token.json")
+    other = FakeCredentials("token-other", utcnow() + timedelta(hours=1), refresh_token="refresh-rotated")
+    credentials.save_token(other, token_file)
+
+    creds = FakeCredentials("token-0", utcnow() - timedelta(seconds=1))
+    provider = CredentialsProvider(creds, token_file=token_file, refresh_margin=300)
+
+    assert provider.get_credentials() is creds
+    assert creds.refresh_calls == 0
+    assert creds.token == "token-other"
+    assert creds.refresh_token == "refresh-rotated"
+    assert provider.seconds_until_refresh() > 0
+
+
+def test_each_thread_gets_its_own_service(tmp_path):
+    creds = FakeCredentials("token-0", utcnow() + timedelta(hours=1))
+    provider = CredentialsProvider(creds, token_file=str(tmp_path / "token.json"), refresh_margin=300)
+
+    services = {}
+
+    def worker(name):
+        # Le même thread réutilise toujours son propre service
+        first = provider.get_service()
+        assert provider.get_service() is first
+        services[name] = first
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(services) == 4
+    assert len({id(service) for service in services.values()}) == 4
+    assert provider.get_service() not in services.values()
+    assert creds.refresh_calls == 0
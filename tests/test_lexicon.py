@@ -0,0 +1,61 @@
+# tests/test_lexicon.py
+
+import pytest
+
+from src.config import config
+from src.lexicon import KeywordLexicon, get_lexicon
+from src.rules import DetectionRules
+from src.manager import EmailManager
+
+
+@pytest.fixture
+def rules():
+    return DetectionRules.load()
+
+
+@pytest.mark.parametrize("subject", [
+    "Freedom of information request",
+    "Wholesale invoice attached",
+    "Salesforce login",
+    "Re: offerings for Q3",
+    "Office hours",
+    "Are you free for lunch?",
+    "Un cadeau",
+    "Exclusif",
+])
+def test_words_containing_keywords_are_not_promotional(rules, subject):
+    assert EmailManager.get_promo_reason(rules, {"sender": "bob@corp.com", "subject": subject}) is None
+
+
+@pytest.mark.parametrize("subject", [
+    "Big Sales",
+    "Weekend deals",
+    "Nos offres",
+    "Coupons inside",
+    "Réductions",
+    "Promotions du jour",
+    "50% off",
+    "Des cadeaux exclusifs",
+])
+def test_plurals_and_accents_are_promotional(rules, subject):
+    assert EmailManager.is_promo_email(rules, {"sender": "bob@corp.com", "subject": subject})
+
+
+def test_single_weak_keyword_is_not_enough():
+    lexicon = get_lexicon()
+    assert lexicon.score("Un cadeau") == (0.5, "cadeau")
+    assert lexicon.score("Un cadeau")[0] < config.KEYWORD_THRESHOLD
+
+
+def test_longest_keyword_wins_at_each_position():
+    assert get_lexicon().score("Free shipping on orders") == (1.0, "free shipping")
+
+
+def test_subject_rules_share_the_weighted_score():
+    lexicon = KeywordLexicon([("cadeau", 0.5, "fr")])
+    rules = DetectionRules([], ["Cadeau", "Vente privée"], [], lexicon)
+
+    # La règle de sujet ne contourne pas le poids du lexique...
+    assert EmailManager.get_promo_reason(rules, {"subject": "Un cadeau"}) is None
+    # ...et les règles propres au fichier des sujets comptent pour 1
+    assert EmailManager.get_promo_reason(rules, {"subject": "Vente privée ce soir"}) == "subject:vente privée"